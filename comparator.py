@@ -2,9 +2,23 @@
 
 from typing import List, Dict, Any
 
+import numpy as np
 import pandas as pd
 
-from utils import short_list, safe_get
+from utils import short_list
+
+
+# Product dict key -> comparison table column (in display order)
+_TABLE_COLUMNS = {
+    "asin": "ASIN",
+    "title": "Title",
+    "brand": "Brand",
+    "price": "Price (₹)",
+    "rating": "Rating",
+    "num_reviews": "#Reviews",
+    "features": "Key Features",
+    "url": "URL",
+}
 
 
 def build_comparison_table(products: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -12,31 +26,32 @@ def build_comparison_table(products: List[Dict[str, Any]]) -> pd.DataFrame:
     Build a pandas DataFrame summarizing product comparison.
     Columns: Title, Brand, Price, Rating, Reviews, Features, URL
     """
-    rows = []
-    for p in products:
-        rows.append(
-            {
-                "ASIN": safe_get(p, "asin", ""),
-                "Title": safe_get(p, "title", ""),
-                "Brand": safe_get(p, "brand", ""),
-                "Price (₹)": safe_get(p, "price", None),
-                "Rating": safe_get(p, "rating", None),
-                "#Reviews": safe_get(p, "num_reviews", None),
-                "Key Features": " • ".join(short_list(safe_get(p, "features", []), 3)),
-                "URL": safe_get(p, "url", ""),
-            }
-        )
-    df = pd.DataFrame(rows)
+    # Let pandas pull the fields straight out of the product dicts instead of
+    # re-packing every product into a new row dict first.
+    df = pd.DataFrame.from_records(products, columns=list(_TABLE_COLUMNS))
+
+    text_cols = ["asin", "title", "brand", "url"]
+    df[text_cols] = df[text_cols].fillna("")
+    df["features"] = (
+        df["features"].astype(object).str[:3].str.join(" • ").fillna("")
+    )
+    df = df.rename(columns=_TABLE_COLUMNS)
 
     # Sort: higher rating, more reviews, lower price
     if not df.empty:
         df["Rating"] = df["Rating"].fillna(0)
         df["#Reviews"] = df["#Reviews"].fillna(0)
         df["Price (₹)"] = df["Price (₹)"].fillna(df["Price (₹)"].max() or 0)
-        df = df.sort_values(
-            by=["Rating", "#Reviews", "Price (₹)"],
-            ascending=[False, False, True],
-        ).reset_index(drop=True)
+        # np.lexsort sorts by the last key first; negate the descending keys
+        order = np.lexsort(
+            (
+                df["Price (₹)"].to_numpy(dtype=float),
+                -df["#Reviews"].to_numpy(dtype=float),
+                -df["Rating"].to_numpy(dtype=float),
+            )
+        )
+        df = df.take(order)
+        df.reset_index(drop=True, inplace=True)
 
     return df
 
@@ -4,9 +4,14 @@
 # End-to-end Streamlit app with filters, ranking chart & CSV export
 # -------------------------------------------------------------
 
-from typing import List, Dict, Any, Optional
+import io
+import re
+from typing import List, Dict, Any, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import streamlit as st
 import altair as alt
 
@@ -15,23 +20,81 @@ from scraper import (
     fetch_product_from_asin,
     fetch_product_from_name,
     search_similar_products,
+    DegradedSearchError,
 )
 
+# -------------------------------------------------------------
+# Cached scraper calls
+# -------------------------------------------------------------
+
+# Streamlit re-runs the whole script on every widget change; cache the
+# network-bound scraper calls so repeated queries don't re-scrape Amazon.
+SCRAPE_CACHE_TTL = 3600  # seconds
+
+
+@st.cache_data(ttl=SCRAPE_CACHE_TTL, show_spinner=False)
+def _cached_fetch_product_from_url(url: str) -> Dict[str, Any]:
+    return fetch_product_from_url(url)
+
+
+@st.cache_data(ttl=SCRAPE_CACHE_TTL, show_spinner=False)
+def _cached_fetch_product_from_asin(asin: str) -> Dict[str, Any]:
+    return fetch_product_from_asin(asin)
+
+
+@st.cache_data(ttl=SCRAPE_CACHE_TTL, show_spinner=False)
+def _cached_fetch_product_from_name(name: str) -> Dict[str, Any]:
+    return fetch_product_from_name(name)
+
+
+@st.cache_data(ttl=SCRAPE_CACHE_TTL, show_spinner=False)
+def _cached_search_similar_products(
+    keyword: str,
+    max_products: int,
+    base_product: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    # search_similar_products soft-fails to partial / empty results when
+    # Amazon blocks or throttles us; raise instead so those are not cached
+    # for the whole TTL (see _search_similar_products).
+    results = search_similar_products(
+        keyword=keyword,
+        max_products=max_products,
+        base_product=base_product,
+        raise_if_degraded=True,
+    )
+    if not results:
+        raise RuntimeError(f"No similar products found for {keyword!r}")
+    return results
+
+
 # -------------------------------------------------------------
 # Small helpers
 # -------------------------------------------------------------
 
 
+# Starts with "http" and contains both "amazon." and "/dp/" (any order)
+_AMAZON_URL_RE = re.compile(
+    r"http(?=.*amazon\.)(?=.*/dp/)", re.IGNORECASE | re.DOTALL
+)
+_ASIN_RE = re.compile(r"[A-Za-z0-9]{10}")
+
+
 def _looks_like_amazon_url(text: str) -> bool:
     """Rough check: is this an Amazon product URL?"""
-    text = (text or "").strip().lower()
-    return text.startswith("http") and "amazon." in text and "/dp/" in text
+    return bool(_AMAZON_URL_RE.match((text or "").strip()))
 
 
 def _looks_like_asin(text: str) -> bool:
     """Simple ASIN check: 10 alphanumeric chars."""
-    text = (text or "").strip()
-    return len(text) == 10 and text.isalnum()
+    return bool(_ASIN_RE.fullmatch((text or "").strip()))
+
+
+def _numeric_column(
+    products: List[Dict[str, Any]], key: str, default: Any = None
+) -> np.ndarray:
+    """Extract one numeric field as a float array (missing / invalid -> NaN)."""
+    values = pd.Series([p.get(key, default) for p in products], dtype=object)
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
 
 
 def _product_list_to_df(products: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -42,48 +105,46 @@ def _product_list_to_df(products: List[Dict[str, Any]]) -> pd.DataFrame:
     Expected keys: asin, title, brand, price, rating, num_reviews,
                    features, url, and optional __rel_score.
     """
-    rows = []
-    for p in products:
-        rows.append(
-            {
-                "ASIN": p.get("asin", ""),
-                "Title": p.get("title", ""),
-                "Brand": p.get("brand", ""),
-                "Price (₹)": p.get("price"),
-                "Rating": p.get("rating"),
-                "#Reviews": p.get("num_reviews"),
-                "Key Features": "; ".join(p.get("features", [])),
-                "URL": p.get("url", ""),
-                "SimilarityScore": round(p.get("__rel_score", 0.0), 2),
-            }
-        )
-
-    df = pd.DataFrame(rows)
-
-    # Ensure numeric types
-    if not df.empty:
-        df["Price (₹)"] = pd.to_numeric(df["Price (₹)"], errors="coerce")
-        df["Rating"] = pd.to_numeric(df["Rating"], errors="coerce")
-        df["#Reviews"] = pd.to_numeric(df["#Reviews"], errors="coerce")
+    # Build column-by-column with the numeric dtypes fixed up front, instead
+    # of row dicts that need a to_numeric pass per column afterwards.
+    df = pd.DataFrame(
+        {
+            "ASIN": [p.get("asin", "") for p in products],
+            "Title": [p.get("title", "") for p in products],
+            # Related products are mostly from the same brand -> small category set
+            "Brand": pd.Categorical([p.get("brand", "") for p in products]),
+            "Price (₹)": _numeric_column(products, "price"),
+            "Rating": _numeric_column(products, "rating"),
+            "#Reviews": _numeric_column(products, "num_reviews"),
+            "Key Features": ["; ".join(p.get("features", [])) for p in products],
+            "URL": [p.get("url", "") for p in products],
+            "SimilarityScore": np.round(
+                _numeric_column(products, "__rel_score", 0.0), 2
+            ),
+        }
+    )
 
     return df
 
 
 def _build_pros_cons(
-    product: Dict[str, Any],
-    all_prices: pd.Series,
-    all_ratings: pd.Series,
+    price: float,
+    rating: float,
+    reviews: float,
+    median_price: float,
+    median_rating: float,
 ) -> Dict[str, List[str]]:
-    """Generate simple pros / cons based on rating, reviews & price."""
+    """
+    Generate simple pros / cons based on rating, reviews & price.
+    Values come from one row of the comparison DataFrame (NaN = missing);
+    medians are computed once by the caller for the whole comparison set.
+    """
     pros: List[str] = []
     cons: List[str] = []
 
-    rating = product.get("rating") or 0.0
-    reviews = product.get("num_reviews") or 0
-    price = product.get("price")
-
-    median_price = all_prices.median() if not all_prices.empty else price
-    median_rating = all_ratings.median() if not all_ratings.empty else rating
+    rating = 0.0 if pd.isna(rating) else rating
+    reviews = 0 if pd.isna(reviews) else reviews
+    price = None if pd.isna(price) else price
 
     # --- Pros
     if rating >= 4.4:
@@ -97,7 +158,7 @@ def _build_pros_cons(
         pros.append("Reasonable number of reviews")
 
     if price is not None:
-        pros.append(f"Price around ₹{price:,}")
+        pros.append(f"Price around ₹{price:,.0f}")
 
     # --- Cons
     if rating and median_rating and rating < median_rating:
@@ -112,40 +173,122 @@ def _build_pros_cons(
     return {"pros": pros, "cons": cons}
 
 
-def _choose_best_product(df: pd.DataFrame) -> Optional[pd.Series]:
+def _norm(values: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """Min–max normalisation helper (works on raw NumPy arrays)."""
+    if values.size == 0:
+        return values
+    mx, mn = values.max(), values.min()
+    if mx == mn:
+        return np.ones_like(values)
+    if higher_is_better:
+        return (values - mn) / (mx - mn)
+    else:
+        return (mx - values) / (mx - mn)
+
+
+# -------------------------------------------------------------
+# Fetch pipeline
+# -------------------------------------------------------------
+
+
+def _fetch_base_product(raw_value: str, method: str) -> Dict[str, Any]:
+    """Fetch the base product (with ASIN fallback via URL if needed)."""
+    if method == "Product Name":
+        return _cached_fetch_product_from_name(raw_value)
+
+    if method == "ASIN":
+        # First try dedicated ASIN scraper
+        try:
+            return _cached_fetch_product_from_asin(raw_value)
+        except Exception:
+            # Fallback: construct URL from ASIN
+            fallback_url = f"https://www.amazon.in/dp/{raw_value}"
+            return _cached_fetch_product_from_url(fallback_url)
+
+    # Amazon URL
+    return _cached_fetch_product_from_url(raw_value)
+
+
+def _search_similar_products(
+    keyword: str, base_product: Dict[str, Any]
+) -> List[Dict[str, Any]]:
     """
-    Simple heuristic (kept for reference, not used in final score):
-    1. Highest rating
-    2. Then highest #reviews
-    3. Then lowest price
+    Cached similar-product search. A degraded search (some pages failed)
+    still returns what it found, just uncached; a failed one returns [].
     """
-    if df.empty:
-        return None
-
-    temp = df.copy()
-    temp["Rating_fill"] = temp["Rating"].fillna(0)
-    temp["Reviews_fill"] = temp["#Reviews"].fillna(0)
-    temp["Price_fill"] = temp["Price (₹)"].fillna(temp["Price (₹)"].max())
-
-    temp = temp.sort_values(
-        by=["Rating_fill", "Reviews_fill", "Price_fill"],
-        ascending=[False, False, True],
-        kind="mergesort",
-    )
-    return temp.iloc[0]
+    try:
+        return _cached_search_similar_products(
+            keyword=keyword,
+            max_products=15,
+            base_product=base_product,
+        )
+    except DegradedSearchError as e:
+        return e.results
+    except Exception:
+        return []
 
 
-def _norm(series: pd.Series, higher_is_better: bool = True) -> pd.Series:
-    """Min–max normalisation helper."""
-    if series.empty:
-        return series
-    mx, mn = series.max(), series.min()
-    if mx == mn:
-        return pd.Series(1.0, index=series.index)
-    if higher_is_better:
-        return (series - mn) / (mx - mn)
-    else:
-        return (mx - series) / (mx - mn)
+def _fetch_related_products(
+    base_product: Dict[str, Any], raw_value: str
+) -> List[Dict[str, Any]]:
+    """Fetch up to 4 related products (aggressive search + fallback)."""
+    keyword = base_product.get("title") or raw_value
+    brand = (base_product.get("brand") or "").strip()
+
+    related_products: List[Dict[str, Any]] = []
+
+    # Persist across calls; only grown as products are appended
+    seen_asins = {base_product.get("asin", "")}
+    seen_titles = {str(base_product.get("title", "")).strip().lower()}
+
+    def _add_unique_results(results: List[Dict[str, Any]]) -> None:
+        """Extend related_products with new ASIN/title combinations only."""
+        for p in results:
+            if len(related_products) >= 4:  # base + 4 = 5 total
+                break
+            asin = p.get("asin", "")
+            title = str(p.get("title", "")).strip().lower()
+            if asin and asin in seen_asins:
+                continue
+            if title and title in seen_titles:
+                continue
+            related_products.append(p)
+            seen_asins.add(asin)
+            seen_titles.add(title)
+
+    # 1️⃣ Full title search – higher max_products for better coverage
+    _add_unique_results(_search_similar_products(keyword, base_product))
+
+    # 2️⃣ Shorter keyword (first 4 words)
+    if len(related_products) < 4:
+        short_kw = " ".join(str(keyword).split()[:4])
+        if short_kw and short_kw.lower() != str(keyword).lower():
+            _add_unique_results(_search_similar_products(short_kw, base_product))
+
+    # 3️⃣ Brand + main keyword (for categories like headphones)
+    if len(related_products) < 4 and brand:
+        combo_kw = f"{brand} {short_kw or keyword}"
+        _add_unique_results(_search_similar_products(combo_kw, base_product))
+
+    return related_products
+
+
+def _fetch_all(
+    raw_value: str, method: str
+) -> Tuple[List[Dict[str, Any]], pd.DataFrame]:
+    """
+    Run the whole fetch + DataFrame build for one query.
+
+    Deliberately not cached as a whole: a throttled run comes back with
+    few or no related products and must not be pinned. main() keeps the
+    result in st.session_state so slider / filter changes reuse it.
+    """
+    base_product = _fetch_base_product(raw_value, method)
+    related_products = _fetch_related_products(base_product, raw_value)
+
+    # Always keep at most 4 related + 1 base = 5 total
+    all_products = [base_product] + related_products[:4]
+    return all_products, _product_list_to_df(all_products)
 
 
 # -------------------------------------------------------------
@@ -206,10 +349,16 @@ def main():
 
     analyze_clicked = st.button("Analyze / Compare Products", type="primary")
 
-    if not analyze_clicked:
+    # Remember the submitted query so filter changes (which re-run the script)
+    # keep showing the results instead of falling back to the empty form.
+    if analyze_clicked:
+        st.session_state["submitted_query"] = (input_method, user_value.strip())
+        st.session_state.pop("fetch_result", None)  # a click always re-fetches
+
+    if "submitted_query" not in st.session_state:
         st.stop()
 
-    raw_value = user_value.strip()
+    input_method, raw_value = st.session_state["submitted_query"]
     if not raw_value:
         st.error("Please enter a value before running the comparison.")
         st.stop()
@@ -238,133 +387,48 @@ def main():
             )
 
     # ---------------------------------------------------------
-    # Fetch base product (with ASIN fallback via URL if needed)
-    # ---------------------------------------------------------
-
-    try:
-        if effective_method == "Product Name":
-            base_product = fetch_product_from_name(raw_value)
-
-        elif effective_method == "ASIN":
-            # First try dedicated ASIN scraper
-            try:
-                base_product = fetch_product_from_asin(raw_value)
-            except Exception:
-                # Fallback: construct URL from ASIN
-                fallback_url = f"https://www.amazon.in/dp/{raw_value}"
-                base_product = fetch_product_from_url(fallback_url)
-
-        else:  # Amazon URL
-            base_product = fetch_product_from_url(raw_value)
-
-    except Exception as e:
-        if effective_method == "Amazon URL":
-            st.error(
-                "Could not fetch base product from the Amazon URL.\n\n"
-                "Please make sure it is a valid **Amazon.in product link** "
-                "(e.g., https://www.amazon.in/dp/B09XS7JWHH).\n\n"
-                f"Details: {e}"
-            )
-        elif effective_method == "ASIN":
-            st.error(
-                "Could not fetch base product using the ASIN provided.\n\n"
-                "Please check the ASIN (10 characters, letters+numbers).\n\n"
-                f"Details: {e}"
-            )
-        else:
-            st.error(
-                "Could not fetch base product using the product name.\n\n"
-                "Tip: Try using the exact **ASIN** or full **Amazon URL** "
-                "if product name search fails.\n\n"
-                f"Details: {e}"
-            )
-        st.stop()
-
-    # ---------------------------------------------------------
-    # Fetch related products (aggressive search + fallback)
+    # Fetch base + related products (once per submitted query)
     # ---------------------------------------------------------
 
-    keyword = base_product.get("title") or raw_value
-    brand = (base_product.get("brand") or "").strip()
-
-    related_products: List[Dict[str, Any]] = []
-
-    def _add_unique_results(results: List[Dict[str, Any]]) -> None:
-        """Extend related_products with new ASIN/title combinations only."""
-        nonlocal related_products
-        seen_asins = {base_product.get("asin", "")}
-        seen_titles = {str(base_product.get("title", "")).strip().lower()}
-        for p in related_products:
-            seen_asins.add(p.get("asin", ""))
-            seen_titles.add(str(p.get("title", "")).strip().lower())
-
-        for p in results:
-            asin = p.get("asin", "")
-            title = str(p.get("title", "")).strip().lower()
-            if asin and asin in seen_asins:
-                continue
-            if title and title in seen_titles:
-                continue
-            related_products.append(p)
-            seen_asins.add(asin)
-            seen_titles.add(title)
-            if len(related_products) >= 4:  # base + 4 = 5 total
-                break
-
-    with st.spinner("Fetching related products from Amazon.in ..."):
+    query = (raw_value, effective_method)
+    fetch_result = st.session_state.get("fetch_result")
+    if fetch_result is not None and fetch_result[0] == query:
+        _, all_products, comparison_df = fetch_result
+    else:
         try:
-            # 1️⃣ Full title search – higher max_products for better coverage
-            res1 = search_similar_products(
-                keyword=keyword,
-                max_products=15,
-                base_product=base_product,
-            )
-        except Exception:
-            res1 = []
-        _add_unique_results(res1)
-
-        # 2️⃣ Shorter keyword (first 4 words)
-        if len(related_products) < 4:
-            short_kw = " ".join(str(keyword).split()[:4])
-            if short_kw and short_kw.lower() != str(keyword).lower():
-                try:
-                    res2 = search_similar_products(
-                        keyword=short_kw,
-                        max_products=15,
-                        base_product=base_product,
-                    )
-                except Exception:
-                    res2 = []
-                _add_unique_results(res2)
-
-        # 3️⃣ Brand + main keyword (for categories like headphones)
-        if len(related_products) < 4 and brand:
-            combo_kw = f"{brand} {short_kw or keyword}"
-            try:
-                res3 = search_similar_products(
-                    keyword=combo_kw,
-                    max_products=15,
-                    base_product=base_product,
+            with st.spinner("Fetching products from Amazon.in ..."):
+                all_products, comparison_df = _fetch_all(*query)
+            st.session_state["fetch_result"] = (query, all_products, comparison_df)
+
+        except Exception as e:
+            if effective_method == "Amazon URL":
+                st.error(
+                    "Could not fetch base product from the Amazon URL.\n\n"
+                    "Please make sure it is a valid **Amazon.in product link** "
+                    "(e.g., https://www.amazon.in/dp/B09XS7JWHH).\n\n"
+                    f"Details: {e}"
+                )
+            elif effective_method == "ASIN":
+                st.error(
+                    "Could not fetch base product using the ASIN provided.\n\n"
+                    "Please check the ASIN (10 characters, letters+numbers).\n\n"
+                    f"Details: {e}"
                 )
-            except Exception:
-                res3 = []
-            _add_unique_results(res3)
+            else:
+                st.error(
+                    "Could not fetch base product using the product name.\n\n"
+                    "Tip: Try using the exact **ASIN** or full **Amazon URL** "
+                    "if product name search fails.\n\n"
+                    f"Details: {e}"
+                )
+            st.stop()
 
-    if not related_products:
+    if len(all_products) == 1:
         st.warning(
             "Base product fetched successfully, but no strong related products were "
             "found. Showing only the base product."
         )
 
-    # Always keep at most 4 related + 1 base = 5 total
-    all_products = [base_product] + related_products[:4]
-
-    # ---------------------------------------------------------
-    # Convert to DataFrame
-    # ---------------------------------------------------------
-
-    comparison_df = _product_list_to_df(all_products)
-
     if comparison_df.empty:
         st.error("No comparable product data available.")
         st.stop()
@@ -377,11 +441,16 @@ def main():
 
     st.subheader("Filters")
 
-    price_min = int(comparison_df["Price (₹)"].min() or 0)
-    price_max = int(comparison_df["Price (₹)"].max() or 0)
-    rating_min = float(comparison_df["Rating"].min() or 0.0)
-    rating_max = float(comparison_df["Rating"].max() or 5.0)
-    reviews_max = int(comparison_df["#Reviews"].max() or 0)
+    # One aggregation pass for slider bounds + pros/cons medians
+    stats = comparison_df[["Price (₹)", "Rating", "#Reviews"]].agg(
+        ["min", "max", "median"]
+    )
+
+    price_min = int(stats.at["min", "Price (₹)"] or 0)
+    price_max = int(stats.at["max", "Price (₹)"] or 0)
+    rating_min = float(stats.at["min", "Rating"] or 0.0)
+    rating_max = float(stats.at["max", "Rating"] or 5.0)
+    reviews_max = int(stats.at["max", "#Reviews"] or 0)
 
     c1, c2, c3 = st.columns(3)
 
@@ -413,26 +482,29 @@ def main():
             step=100,
         )
 
-    # Apply filters
-    filtered_df = comparison_df.copy()
-    filtered_df = filtered_df[
-        (filtered_df["Price (₹)"].fillna(price_max) <= max_budget)
-        & (filtered_df["Rating"].fillna(0.0) >= min_rating)
-        & (filtered_df["#Reviews"].fillna(0) >= min_reviews)
-    ]
+    # Apply filters (one vectorised mask over the raw NumPy columns)
+    price_arr = comparison_df["Price (₹)"].to_numpy(dtype=float)
+    rating_arr = comparison_df["Rating"].to_numpy(dtype=float)
+    reviews_arr = comparison_df["#Reviews"].to_numpy(dtype=float)
+
+    mask = (
+        (np.nan_to_num(price_arr, nan=price_max) <= max_budget)
+        & (np.nan_to_num(rating_arr, nan=0.0) >= min_rating)
+        & (np.nan_to_num(reviews_arr, nan=0.0) >= min_reviews)
+    )
+    filtered_df = comparison_df.iloc[mask]
 
     if filtered_df.empty:
         st.warning(
             "No products match the current filters. Filters reset to show all products."
         )
-        filtered_df = comparison_df.copy()
+        filtered_df = comparison_df
 
     # Stable order; ranking will be done by score
-    filtered_df = filtered_df.sort_values(
-        by=["Title"],
-        ascending=[True],
-        kind="mergesort",
+    title_order = np.argsort(
+        filtered_df["Title"].to_numpy(dtype=object), kind="stable"
     )
+    filtered_df = filtered_df.iloc[title_order]
 
     # ---------------------------------------------------------
     # Compute overall score (ONLY Price & Rating)
@@ -441,18 +513,17 @@ def main():
     score_df = filtered_df[["Title", "Price (₹)", "Rating"]].dropna()
 
     if not score_df.empty:
-        score_df["rating_norm"] = _norm(score_df["Rating"], True)
-        score_df["price_norm"] = _norm(score_df["Price (₹)"], False)
+        rating_norm = _norm(score_df["Rating"].to_numpy(dtype=float), True)
+        price_norm = _norm(score_df["Price (₹)"].to_numpy(dtype=float), False)
 
         # Overall score (0–100) — weights: Rating 70%, Price 30%
-        score_df["OverallScore"] = (
-            0.7 * score_df["rating_norm"] + 0.3 * score_df["price_norm"]
-        ) * 100
+        score_df["OverallScore"] = (0.7 * rating_norm + 0.3 * price_norm) * 100
 
-        score_df = score_df.sort_values("OverallScore", ascending=False)
-        best_title = score_df.iloc[0]["Title"]
+        # Carry the winner's row label through instead of re-finding it by title
+        best_label = score_df.index[int(score_df["OverallScore"].to_numpy().argmax())]
+        best_title = score_df.at[best_label, "Title"]
     else:
-        best_title = None
+        best_label = None
 
     # ---------------------------------------------------------
     # Comparison Table (assignment style)
@@ -460,27 +531,32 @@ def main():
 
     st.subheader("📊 Comparison Table")
 
-    display_df = filtered_df.copy()
-
-    display_df["Product Name"] = display_df["Title"]
-    display_df["Price"] = display_df["Price (₹)"].apply(
-        lambda x: f"₹{int(x):,}" if pd.notnull(x) else "N/A"
-    )
-    display_df["Rating_display"] = display_df["Rating"].round(1)
-    display_df["Reviews"] = display_df["#Reviews"].apply(
-        lambda x: f"{int(x):,}" if pd.notnull(x) else "N/A"
+    # Build the display table straight from the needed columns (no full copy)
+    pretty_table = pd.DataFrame(
+        {
+            "Product Name": filtered_df["Title"],
+            "Price": filtered_df["Price (₹)"]
+            .map("₹{:,.0f}".format, na_action="ignore")
+            .fillna("N/A"),
+            "Rating": filtered_df["Rating"].round(1),
+            "Reviews": filtered_df["#Reviews"]
+            .map("{:,.0f}".format, na_action="ignore")
+            .fillna("N/A"),
+            "Key Feature": filtered_df["Key Features"]
+            .str.split(";", n=1)
+            .str[0]
+            .fillna(""),
+        }
     )
-    display_df["Key Feature"] = display_df["Key Features"].apply(
-        lambda t: t.split(";")[0] if isinstance(t, str) and t else ""
-    )
-
-    pretty_table = display_df[
-        ["Product Name", "Price", "Rating_display", "Reviews", "Key Feature"]
-    ].rename(columns={"Rating_display": "Rating"})
 
     st.dataframe(pretty_table, use_container_width=True)
 
-    csv_bytes = pretty_table.to_csv(index=False).encode("utf-8")
+    # Arrow's C++ writer emits UTF-8 bytes directly (no intermediate str)
+    csv_buffer = io.BytesIO()
+    pacsv.write_csv(
+        pa.Table.from_pandas(pretty_table, preserve_index=False), csv_buffer
+    )
+    csv_bytes = csv_buffer.getvalue()
     st.download_button(
         label="⬇️ Download comparison as CSV",
         data=csv_bytes,
@@ -495,12 +571,8 @@ def main():
     st.subheader("📊 Overall Score (Price + Rating)")
 
     if not score_df.empty:
-        viz_df = score_df[
-            ["Title", "OverallScore", "Price (₹)", "Rating"]
-        ].copy()
-
-        viz_df["BestFlag"] = viz_df["Title"].apply(
-            lambda t: "Recommended" if t == best_title else "Other"
+        viz_df = score_df[["Title", "OverallScore", "Price (₹)", "Rating"]].assign(
+            BestFlag=lambda d: np.where(d.index == best_label, "Recommended", "Other")
         )
 
         chart = (
@@ -554,13 +626,19 @@ def main():
 
     st.subheader("Quick Pros & Cons")
 
-    price_series = comparison_df["Price (₹)"]
-    rating_series = comparison_df["Rating"]
-
-    for p in all_products:
-        title = p.get("title", "Unknown product")
-        with st.expander(title, expanded=False):
-            pc = _build_pros_cons(p, price_series, rating_series)
+    median_price = stats.at["median", "Price (₹)"]
+    median_rating = stats.at["median", "Rating"]
+
+    # Read the already-built columns instead of re-extracting each product dict
+    for title, price, rating, reviews, url in zip(
+        comparison_df["Title"],
+        comparison_df["Price (₹)"],
+        comparison_df["Rating"],
+        comparison_df["#Reviews"],
+        comparison_df["URL"],
+    ):
+        with st.expander(title or "Unknown product", expanded=False):
+            pc = _build_pros_cons(price, rating, reviews, median_price, median_rating)
             cols = st.columns(2)
             with cols[0]:
                 st.markdown("**Pros**")
@@ -572,30 +650,28 @@ def main():
                     st.markdown(f"- {item}")
 
             st.markdown(
-                f"[View on Amazon]({p.get('url','')})",
+                f"[View on Amazon]({url})",
                 help="Opens the product page on Amazon.in",
             )
 
     # Final recommendation – consistent with score chart
     st.subheader("🏆 Final Recommendation")
 
-    if best_title is None:
+    if best_label is None:
         st.info("Not enough data to choose a clear winner.")
     else:
-        best_full_row = filtered_df[filtered_df["Title"] == best_title].iloc[0]
+        best_full_row = filtered_df.loc[best_label]
         price = best_full_row["Price (₹)"]
         rating = best_full_row["Rating"]
         reviews = int(best_full_row["#Reviews"] or 0)
         url = best_full_row["URL"]
-        score_value = float(
-            score_df[score_df["Title"] == best_title]["OverallScore"].iloc[0]
-        )
+        score_value = float(score_df.at[best_label, "OverallScore"])
 
         st.markdown(
             f"We recommend **{best_title}** as the best overall value.\n\n"
             f"- Overall score (Price + Rating): **{score_value:.1f}/100**\n"
             f"- Rating: **{rating:.1f}★** with **{reviews:,}** reviews\n"
-            f"- Approx. price: **₹{price:,}**"
+            f"- Approx. price: **₹{price:,.0f}**"
         )
         st.markdown(f"[Open recommended product on Amazon]({url})")
 
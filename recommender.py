@@ -2,51 +2,78 @@
 
 from typing import List, Dict, Any
 
-import math
+import numpy as np
 
 from utils import safe_get
 
+# Score weights: tune as desired
+_WEIGHT_RATING = 0.5
+_WEIGHT_REVIEWS = 0.3
+_WEIGHT_PRICE = 0.2
 
-def _score_product(p: Dict[str, Any], max_price: float, max_reviews: float) -> float:
+
+def _score_products(products: List[Dict[str, Any]]) -> np.ndarray:
     """
-    Composite score based on:
+    Composite score for every product at once, based on:
     - rating (0–5)
     - #reviews (popularity)
     - price (lower is better)
     """
-    rating = safe_get(p, "rating", 0.0) or 0.0
-    reviews = float(safe_get(p, "num_reviews", 0) or 0)
-    price = float(safe_get(p, "price", max_price) or max_price)
+    ratings = np.array(
+        [safe_get(p, "rating", 0.0) or 0.0 for p in products], dtype=float
+    )
+    reviews = np.array(
+        [safe_get(p, "num_reviews", 0) or 0 for p in products], dtype=float
+    )
+    prices = np.array([p.get("price") or 0 for p in products], dtype=float)
+
+    max_price = prices.max() or 1.0
+    max_reviews = reviews.max() or 1.0
+    prices[prices == 0] = max_price  # missing price -> most expensive
+
+    return _score_kernel(ratings, reviews, prices, max_reviews, max_price)
 
-    # Normalize
-    rating_norm = rating / 5.0
-    reviews_norm = math.log1p(reviews) / math.log1p(max_reviews) if max_reviews else 0.0
-    price_norm = 1.0 - (price / max_price) if max_price else 0.0  # cheaper = better
 
-    # Weights: tune as desired
-    score = 0.5 * rating_norm + 0.3 * reviews_norm + 0.2 * price_norm
+def _score_kernel(
+    ratings: np.ndarray,
+    reviews: np.ndarray,
+    prices: np.ndarray,
+    max_reviews: float,
+    max_price: float,
+) -> np.ndarray:
+    """
+    Array-only scoring kernel, evaluated in place in two buffers:
+    w_rating * rating/5 + w_reviews * log1p(reviews)/log1p(max_reviews)
+    + w_price * (1 - price/max_price)
+    Terms are built and summed in that order (no reassociation), so exact
+    ties resolve the same way as the scalar formula.
+    """
+    score = ratings / 5.0
+    score *= _WEIGHT_RATING
+
+    term = np.log1p(reviews)
+    term /= np.log1p(max_reviews)
+    term *= _WEIGHT_REVIEWS
+    score += term
+
+    np.divide(prices, max_price, out=term)
+    np.subtract(1.0, term, out=term)  # cheaper = better
+    term *= _WEIGHT_PRICE
+    score += term
     return score
 
 
 def recommend_best(products: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
-    Return (best_product, explanation_text).
+    Return (best_product, explanation_text) plus the winning score.
+    The caller's product dicts are not modified.
     """
     if not products:
         return {"product": None, "reason": "No products available for recommendation."}
 
-    max_price = max([p.get("price") or 0 for p in products]) or 1.0
-    max_reviews = max([p.get("num_reviews") or 0 for p in products]) or 1.0
-
-    best = None
-    best_score = -1.0
-
-    for p in products:
-        score = _score_product(p, max_price, max_reviews)
-        p["__score"] = score
-        if score > best_score:
-            best_score = score
-            best = p
+    scores = _score_products(products)
+    best_idx = int(np.argmax(scores))
+    best = products[best_idx]
 
     if not best:
         return {"product": None, "reason": "Unable to compute a clear winner."}
@@ -70,4 +97,4 @@ def recommend_best(products: List[Dict[str, Any]]) -> Dict[str, Any]:
         + "."
     )
 
-    return {"product": best, "reason": reason_text}
+    return {"product": best, "reason": reason_text, "score": float(scores[best_idx])}
@@ -3,11 +3,18 @@
 import time
 import random
 import math
-from typing import List, Dict, Any, Optional
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple
 from urllib.parse import urljoin, quote_plus
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
 
 from utils import (
     clean_text,
@@ -20,6 +27,15 @@ from utils import (
 
 BASE_AMAZON_URL = "https://www.amazon.in"
 
+# lxml's C parser is several times faster than the pure-Python html.parser
+# on full Amazon product pages; fall back if it isn't installed.
+try:
+    import lxml  # noqa: F401
+
+    _HTML_PARSER = "lxml"
+except ImportError:
+    _HTML_PARSER = "html.parser"
+
 # ------------------------------------------------------------------------
 # HTTP helpers
 # ------------------------------------------------------------------------
@@ -34,38 +50,162 @@ USER_AGENTS = [
 ]
 
 
-def _make_headers() -> dict:
-    return {
+# One shared session so repeated requests to amazon.in reuse the pooled
+# keep-alive connection instead of a new TCP + TLS handshake per page.
+# The User-Agent is picked once per process: switching it on every request
+# makes consecutive calls look like unrelated clients to Amazon's edge.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0),
+)
+_SESSION.headers.update(
+    {
         "User-Agent": random.choice(USER_AGENTS),
         "Accept-Language": "en-IN,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
+        # "gzip, deflate", plus "br" only when a brotli decoder is installed,
+        # so Amazon never sends a body urllib3 cannot decode natively.
+        "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
     }
+)
 
 
-def _get_soup(url: str, retries: int = 3) -> BeautifulSoup:
+# Recently fetched page bodies keyed by URL, so one comparison run (base
+# page, similar-items scan, candidate pages across several searches) does
+# not download the same page twice. Raw product pages run 0.5-2 MB, so the
+# cache is an LRU capped at _PAGE_CACHE_MAX entries; entries also expire
+# after a few minutes so stale prices are not served. The cap covers one
+# run's working set (base page, up to 3 search pages and ~60 candidates per
+# search pass): anything smaller evicts the base page and shared candidates
+# before the next pass needs them.
+_PAGE_CACHE: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+_PAGE_CACHE_MAX = 128
+_PAGE_CACHE_TTL = 300  # seconds
+_PAGE_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(url: str) -> Optional[bytes]:
+    with _PAGE_CACHE_LOCK:
+        entry = _PAGE_CACHE.get(url)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= _PAGE_CACHE_TTL:
+            del _PAGE_CACHE[url]
+            return None
+        _PAGE_CACHE.move_to_end(url)
+    return entry[1]
+
+
+def _cache_put(url: str, html: bytes) -> None:
+    with _PAGE_CACHE_LOCK:
+        _PAGE_CACHE[url] = (time.time(), html)
+        _PAGE_CACHE.move_to_end(url)
+        while len(_PAGE_CACHE) > _PAGE_CACHE_MAX:
+            _PAGE_CACHE.popitem(last=False)
+
+
+# Circuit breaker: after several consecutive throttling failures (5xx, 429,
+# CAPTCHA pages, network errors) stop hitting Amazon for a cooldown period
+# and fail fast, instead of sleeping through every retry of every URL.
+# Once the cooldown passes a single request is let through as a probe
+# (everyone else keeps failing fast): success closes the breaker again,
+# another failure re-opens it immediately.
+_BREAKER = {"fails": 0, "open_until": 0.0}
+_BREAKER_THRESHOLD = 5
+_BREAKER_COOLDOWN = 30  # seconds
+_BREAKER_LOCK = threading.Lock()
+
+_THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+_CAPTCHA_MARKER = b"/errors/validateCaptcha"
+
+
+def _breaker_is_open() -> bool:
+    return time.time() < _BREAKER["open_until"]
+
+
+def _breaker_allow_request() -> bool:
     """
-    Fetch a URL and return BeautifulSoup.
+    False while the breaker is open. After the cooldown the first caller
+    becomes the half-open probe: the window is pushed forward again so
+    concurrent workers don't all hit Amazon at the same moment.
+    """
+    with _BREAKER_LOCK:
+        now = time.time()
+        if now < _BREAKER["open_until"]:
+            return False
+        if _BREAKER["fails"] >= _BREAKER_THRESHOLD:
+            _BREAKER["open_until"] = now + _BREAKER_COOLDOWN
+        return True
+
+
+def _breaker_record_failure() -> None:
+    with _BREAKER_LOCK:
+        _BREAKER["fails"] += 1
+        if _BREAKER["fails"] >= _BREAKER_THRESHOLD:
+            _BREAKER["open_until"] = time.time() + _BREAKER_COOLDOWN
+
+
+def _breaker_record_success() -> None:
+    with _BREAKER_LOCK:
+        _BREAKER["fails"] = 0
+        _BREAKER["open_until"] = 0.0
+
+
+def _fetch_html(url: str, retries: int = 3) -> bytes:
+    """
+    Fetch a URL and return the raw page body (served from the short-lived
+    page cache when possible). Bytes are handed straight to the parser,
+    which skips building a decoded copy of the whole page.
     Retries for transient 5xx errors like 503.
     """
+    cached = _cache_get(url)
+    if cached is not None:
+        return cached
+
     last_err: Optional[Exception] = None
 
     for attempt in range(retries):
+        if not _breaker_allow_request():
+            raise RuntimeError(
+                f"Amazon is throttling requests; not fetching {url} "
+                f"during the {_BREAKER_COOLDOWN}s cooldown."
+            )
+
         try:
-            resp = requests.get(url, headers=_make_headers(), timeout=15)
+            resp = _SESSION.get(url, timeout=15)
 
-            # Handle transient 5xx errors with retry
-            if resp.status_code in (500, 502, 503, 504):
+            # Handle transient 5xx errors / rate limiting with retry
+            if resp.status_code in _THROTTLE_STATUSES:
                 last_err = RuntimeError(
                     f"Server error {resp.status_code} while fetching {url}"
                 )
+                _breaker_record_failure()
                 time.sleep(1 + attempt)  # backoff
                 continue
 
+            body = resp.content
+            if _CAPTCHA_MARKER in body:
+                last_err = RuntimeError(f"Amazon returned a CAPTCHA page for {url}")
+                _breaker_record_failure()
+                time.sleep(1 + attempt)
+                continue
+
+            # Any other answer (even a 404) proves Amazon is reachable, so it
+            # closes the breaker -- including after a half-open probe.
+            _breaker_record_success()
             resp.raise_for_status()
-            return BeautifulSoup(resp.text, "html.parser")
+
+            _cache_put(url, body)
+            return body
+
+        except requests.HTTPError as e:
+            # Plain 4xx (e.g. a delisted carousel ASIN): retrying won't help
+            raise RuntimeError(f"Failed to fetch URL: {url}\nReason: {e}") from e
 
         except Exception as e:
             last_err = e
+            if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                _breaker_record_failure()
             time.sleep(1 + attempt)
 
     raise RuntimeError(
@@ -73,10 +213,24 @@ def _get_soup(url: str, retries: int = 3) -> BeautifulSoup:
     )
 
 
+def _get_soup(
+    url: str,
+    retries: int = 3,
+    parse_only: Optional[SoupStrainer] = None,
+) -> BeautifulSoup:
+    """
+    Fetch a URL and return BeautifulSoup.
+    `parse_only` restricts parsing to the matching subtrees.
+    """
+    html = _fetch_html(url, retries)
+    return BeautifulSoup(html, _HTML_PARSER, parse_only=parse_only)
+
+
 # ------------------------------------------------------------------------
 # URL normalisation
 # ------------------------------------------------------------------------
 
+@lru_cache(maxsize=1024)
 def _normalize_product_url(url: str) -> str:
     """
     Always convert any Amazon product URL (with tracking / ref params)
@@ -95,28 +249,43 @@ def _normalize_product_url(url: str) -> str:
 # Amazon search helpers (Search results)
 # ------------------------------------------------------------------------
 
+# Only the result cards matter on a search page
+_SEARCH_RESULTS_ONLY = SoupStrainer(
+    "div", attrs={"data-component-type": "s-search-result"}
+)
+
+
 def _build_amazon_search_url(keyword: str) -> str:
     q = quote_plus(keyword)
     return f"{BASE_AMAZON_URL}/s?k={q}"
 
 
-def _search_amazon_products(keyword: str, max_products: int = 10) -> List[str]:
+def _search_amazon_products(
+    keyword: str,
+    max_products: int = 10,
+    errors: Optional[List[str]] = None,
+) -> List[str]:
     """
     Use Amazon.in search (s?k=...) to discover product URLs.
-    If Amazon blocks us (503 etc.), we return [] instead of crashing.
+    If Amazon blocks us (503 etc.), we return [] instead of crashing
+    (and add the search URL to `errors`, if given).
     """
     search_url = _build_amazon_search_url(keyword)
 
     try:
-        soup = _get_soup(search_url)
+        soup = _get_soup(search_url, parse_only=_SEARCH_RESULTS_ONLY)
     except Exception as e:
         print(f"[WARN] Amazon search failed for {search_url}: {e}")
+        if errors is not None:
+            errors.append(search_url)
         return []  # soft fail
 
     product_urls: List[str] = []
     seen = set()
 
-    for card in soup.select("div[data-component-type='s-search-result']"):
+    for card in soup.find_all(
+        "div", attrs={"data-component-type": "s-search-result"}
+    ):
         a = card.select_one(
             "a.a-link-normal.s-no-outline, a.a-link-normal.a-text-normal"
         )
@@ -146,26 +315,33 @@ def _search_amazon_products(keyword: str, max_products: int = 10) -> List[str]:
 # “Similar products” from product detail page
 # ------------------------------------------------------------------------
 
+# Only ASIN-tagged carousel items matter for similar-product discovery
+_DATA_ASIN_ONLY = SoupStrainer(["li", "div"], attrs={"data-asin": True})
+
+
 def _extract_similar_urls_from_product_page(
     product_url: str,
     exclude_asin: Optional[str],
     max_urls: int = 10,
+    errors: Optional[List[str]] = None,
 ) -> List[str]:
     """
     Look at the product detail page and grab ASINs from
     recommendation carousels (Sponsored, Similar items, etc.).
-    If it fails (503 etc.), return [].
+    If it fails (503 etc.), return [] (and add the URL to `errors`, if given).
     """
     try:
-        soup = _get_soup(product_url)
+        soup = _get_soup(product_url, parse_only=_DATA_ASIN_ONLY)
     except Exception as e:
         print(f"[WARN] Similar-product section fetch failed for {product_url}: {e}")
+        if errors is not None:
+            errors.append(product_url)
         return []  # soft fail
 
     asins: List[str] = []
     seen = set()
 
-    for tag in soup.select("li[data-asin], div[data-asin]"):
+    for tag in soup.find_all(["li", "div"], attrs={"data-asin": True}):
         asin = tag.get("data-asin")
         if not asin:
             continue
@@ -259,11 +435,13 @@ def _parse_product_page(url: str, soup: BeautifulSoup) -> Dict[str, Any]:
 
     # Variants (e.g. colours)
     variants = []
+    variants_seen = set()  # membership checks; the list keeps page order
     for li in soup.select("#variation_color_name li img"):
         alt = li.get("alt")
         if alt:
             alt = clean_text(alt)
-            if alt and alt not in variants:
+            if alt and alt not in variants_seen:
+                variants_seen.add(alt)
                 variants.append(alt)
     variants = short_list(variants, n=6)
 
@@ -341,45 +519,42 @@ def fetch_product_from_name(name: str) -> Dict[str, Any]:
 # Similarity helpers
 # ------------------------------------------------------------------------
 
-_STOPWORDS = {
-    "with",
-    "for",
-    "and",
-    "the",
-    "inch",
-    "cm",
-    "gb",
-    "green",
-    "black",
-    "white",
-    "blue",
-    "phone",
-    "smartphone",
-    "series",
-    "model",
-    "new",
-}
+_STOPWORDS = frozenset(
+    {
+        "with",
+        "for",
+        "and",
+        "the",
+        "inch",
+        "cm",
+        "gb",
+        "green",
+        "black",
+        "white",
+        "blue",
+        "phone",
+        "smartphone",
+        "series",
+        "model",
+        "new",
+    }
+)
+
+
+# Runs of alphanumeric characters (same as str.isalnum, i.e. \w minus "_")
+_TOKEN_RE = re.compile(r"[^\W_]+")
 
 
 def _tokenize(text: str) -> set:
-    text = text.lower()
-    tokens = []
-    word = []
-    for ch in text:
-        if ch.isalnum():
-            word.append(ch)
-        else:
-            if word:
-                tokens.append("".join(word))
-                word = []
-    if word:
-        tokens.append("".join(word))
-
-    return {t for t in tokens if t not in _STOPWORDS and len(t) > 1}
-
-
-def _title_similarity(base_title: str, cand_title: str) -> float:
-    base_tokens = _tokenize(base_title)
+    return {
+        t
+        for t in _TOKEN_RE.findall(text.lower())
+        if len(t) > 1 and t not in _STOPWORDS
+    }
+
+
+def _title_similarity(base_tokens: set, cand_title: str) -> float:
+    """Share of the (pre-tokenized) base title tokens found in cand_title."""
     cand_tokens = _tokenize(cand_title)
     if not base_tokens or not cand_tokens:
         return 0.0
@@ -391,96 +566,166 @@ def _title_similarity(base_title: str, cand_title: str) -> float:
 # Public: related product detection
 # ------------------------------------------------------------------------
 
+# Candidate pages are I/O-bound; fetch a few at a time instead of one by one
+_FETCH_WORKERS = 5
+
+
+def _fetch_candidate(url: str) -> Optional[Dict[str, Any]]:
+    """Fetch one related-product candidate; returns None on failure."""
+    try:
+        # No point pacing requests that will fail fast (or come from the
+        # page cache) while the breaker is open.
+        if not _breaker_is_open():
+            time.sleep(random.uniform(1, 2.0))  # per-worker jitter
+        return fetch_product_from_url(url)
+    except Exception as e:
+        print(f"[WARN] Failed to fetch related product {url}: {e}")
+        return None
+
+
+class DegradedSearchError(RuntimeError):
+    """
+    Raised by search_similar_products(raise_if_degraded=True) when some
+    page fetches failed (throttling, CAPTCHA, 404 ...). `results` holds the
+    products that were still found, so callers can show them without
+    treating them as the complete answer (e.g. without caching them).
+    """
+
+    def __init__(self, results: List[Dict[str, Any]], failed_urls: List[str]):
+        super().__init__(
+            f"{len(failed_urls)} page fetch(es) failed during similar-product "
+            f"search; {len(results)} product(s) found."
+        )
+        self.results = results
+        self.failed_urls = failed_urls
+
+
 def search_similar_products(
     keyword: str,
     max_products: int = 5,
     base_product: Optional[Dict[str, Any]] = None,
+    raise_if_degraded: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Identify related products using:
     - Similar-product carousels on the base product page
     - Amazon search results (s?k=...)
     - Keyword + brand + title similarity scoring
-    Handles 503 and returns [] instead of crashing.
+    Handles 503 and returns [] instead of crashing. With raise_if_degraded,
+    a search where any page fetch failed raises DegradedSearchError
+    (carrying the partial results) instead.
     """
+    products, failed = _collect_similar_products(keyword, max_products, base_product)
+    if failed and raise_if_degraded:
+        raise DegradedSearchError(products, failed)
+    return products
+
 
-    candidate_urls: List[str] = []
-    seen_urls = set()
+def _collect_similar_products(
+    keyword: str,
+    max_products: int,
+    base_product: Optional[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """search_similar_products() body; also returns the URLs that failed."""
 
-    # 1️⃣ Similar-product section from base product page
-    if base_product and base_product.get("url"):
-        base_asin = base_product.get("asin")
-        similar_urls = _extract_similar_urls_from_product_page(
-            product_url=_normalize_product_url(base_product["url"]),
-            exclude_asin=base_asin,
-            max_urls=max_products * 2,
+    base_asin = base_product.get("asin") if base_product else None
+    failed: List[str] = []
+
+    with ThreadPoolExecutor(max_workers=_FETCH_WORKERS) as pool:
+        # 1️⃣ + 2️⃣ The base page's similar-product carousels and the Amazon
+        # search results are independent requests, so fetch them together.
+        search_future = pool.submit(
+            _search_amazon_products,
+            keyword,
+            max_products=max_products * 2,
+            errors=failed,
         )
-        for u in similar_urls:
-            if u not in seen_urls:
-                seen_urls.add(u)
-                candidate_urls.append(u)
-
-    # 2️⃣ Amazon search results
-    search_urls = _search_amazon_products(keyword, max_products=max_products * 2)
-    for u in search_urls:
-        if u not in seen_urls:
-            seen_urls.add(u)
-            candidate_urls.append(u)
-
-    if not candidate_urls:
-        return []
-
-    # 3️⃣ Scrape details for each candidate
-    products: List[Dict[str, Any]] = []
-    for url in candidate_urls:
-        try:
-            time.sleep(random.uniform(1, 2.0))
-            p = fetch_product_from_url(url)
-            if not p.get("title"):
+        similar_urls: List[str] = []
+        if base_product and base_product.get("url"):
+            similar_urls = _extract_similar_urls_from_product_page(
+                product_url=_normalize_product_url(base_product["url"]),
+                exclude_asin=base_asin,
+                max_urls=max_products * 2,
+                errors=failed,
+            )
+        search_urls = search_future.result()
+
+        # Dedup by ASIN up front (search links carry slugs / ref paths,
+        # carousel links are canonical), and never fetch the base product.
+        candidate_urls: List[str] = []
+        seen = {base_asin} if base_asin else set()
+        for u in similar_urls + search_urls:
+            asin = extract_asin_from_url(u)
+            key = asin or u
+            if key in seen:
                 continue
-            products.append(p)
-        except Exception as e:
-            print(f"[WARN] Failed to fetch related product {url}: {e}")
+            seen.add(key)
+            candidate_urls.append(
+                build_amazon_product_url_from_asin(asin) if asin else u
+            )
+
+        if not candidate_urls:
+            return [], failed
+
+        # 3️⃣ Scrape details for each candidate (concurrently, order preserved)
+        fetched = list(pool.map(_fetch_candidate, candidate_urls))
+        failed.extend(u for u, p in zip(candidate_urls, fetched) if p is None)
+        products = [p for p in fetched if p and p.get("title")]
 
     if not products:
-        return []
+        return [], failed
 
     # 4️⃣ Score by similarity + brand + rating + popularity
     base_title = base_product.get("title", "") if base_product else keyword
+    base_tokens = _tokenize(base_title)  # once, not per candidate
     base_brand = (base_product.get("brand", "") or "").lower() if base_product else ""
 
-    for p in products:
-        title_sim = _title_similarity(base_title, p.get("title", ""))
+    # Popularity: log(#reviews) relative to the most-reviewed candidate
+    pop_terms = [math.log1p(p.get("num_reviews") or 0) for p in products]
+    max_pop = max(pop_terms) or 1.0
+
+    for p, pop_term in zip(products, pop_terms):
+        title_sim = _title_similarity(base_tokens, p.get("title", ""))
         brand_match = (
             1.0
             if (base_brand and base_brand in (p.get("brand", "").lower()))
             else 0.0
         )
         rating = p.get("rating") or 0.0
-        reviews = p.get("num_reviews") or 0
-        pop_term = math.log1p(reviews)
 
         p["__rel_score"] = (
             0.55 * title_sim
             + 0.20 * brand_match
             + 0.15 * (rating / 5.0)
-            + 0.10 * (pop_term / math.log1p(max(1, reviews)))
+            + 0.10 * (pop_term / max_pop)
         )
 
     products.sort(key=lambda x: x.get("__rel_score", 0.0), reverse=True)
 
-    strong = [p for p in products if p.get("__rel_score", 0.0) >= 0.30]
-    if len(strong) < max_products:
-        strong = [p for p in products if p.get("__rel_score", 0.0) >= 0.15]
-    if len(strong) < max_products:
-        strong = products
+    # Sorted by score, so each threshold keeps a prefix of `products`: count
+    # both prefixes in one walk, then use the strictest threshold (0.30, else
+    # 0.15, else everything) that still leaves max_products candidates.
+    n_strong = n_medium = 0
+    for p in products:
+        score = p["__rel_score"]
+        if score < 0.15:
+            break
+        n_medium += 1
+        if score >= 0.30:
+            n_strong += 1
+
+    if n_strong >= max_products:
+        limit = n_strong
+    elif n_medium >= max_products:
+        limit = n_medium
+    else:
+        limit = len(products)
 
     # 5️⃣ Remove duplicates and base ASIN
     final: List[Dict[str, Any]] = []
     seen_asins = set()
-    base_asin = base_product.get("asin") if base_product else None
 
-    for p in strong:
+    for p in islice(products, limit):
         asin = p.get("asin")
         if not asin or asin == base_asin:
             continue
@@ -491,4 +736,4 @@ def search_similar_products(
         if len(final) >= max_products:
             break
 
-    return final
+    return final, failed
@@ -1,11 +1,16 @@
 # app/utils.py
 
 import re
+from functools import lru_cache
 from urllib.parse import urlparse, parse_qs, urlencode, quote_plus
 
 
 AMAZON_IN_DOMAIN = "amazon.in"
 
+_ASIN_PATH_RE = re.compile(r"/(?:dp|gp/product)/([A-Z0-9]{8,12})")
+_ASIN_FALLBACK_RE = re.compile(r"(B0[A-Z0-9]{8,10})")
+_NON_DIGIT_RE = re.compile(r"[^\d]")
+
 
 def clean_text(text: str) -> str:
     if not text:
@@ -13,6 +18,7 @@ def clean_text(text: str) -> str:
     return " ".join(text.replace("\n", " ").split())
 
 
+@lru_cache(maxsize=1024)
 def extract_asin_from_url(url: str) -> str | None:
     """
     Extract ASIN from typical Amazon URLs:
@@ -24,12 +30,12 @@ def extract_asin_from_url(url: str) -> str | None:
         return None
 
     path = urlparse(url).path
-    m = re.search(r"/(?:dp|gp/product)/([A-Z0-9]{8,12})", path)
+    m = _ASIN_PATH_RE.search(path)
     if m:
         return m.group(1)
 
     # Fallback: look for B0... pattern anywhere
-    m = re.search(r"(B0[A-Z0-9]{8,10})", url)
+    m = _ASIN_FALLBACK_RE.search(url)
     return m.group(1) if m else None
 
 
@@ -62,7 +68,7 @@ def parse_price_to_int(price_text: str | None) -> int | None:
     if not price_text:
         return None
     # Keep digits only
-    digits = re.sub(r"[^\d]", "", price_text)
+    digits = _NON_DIGIT_RE.sub("", price_text)
     if not digits:
         return None
     try: